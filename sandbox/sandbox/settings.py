@@ -92,6 +92,11 @@ LOGPIPE = {
     # KINESIS_SEQ_NUM_CACHE_SIZE: Defaults to 1000.
     # MIN_MESSAGE_LAG_MS: Defaults to 0ms
     # DEFAULT_FORMAT: Defaults to 'json'
+    # PREFETCH_DEPTH: Defaults to 0 (don't prefetch messages in a background thread)
+    # COMMIT_EVERY_N: Defaults to 1 (commit offsets after every message)
+    # COMMIT_EVERY_MS: Defaults to 0 (don't commit offsets based on elapsed time)
+    # BULK_SIZE: Defaults to 0 (don't bulk save messages)
+    # TXN_BATCH_SIZE: Defaults to 1 (apply each message in its own transaction)
 }
 
 
@@ -35,6 +35,9 @@ extras_require = {
     "msgpack": [
         "msgpack-python",
     ],
+    "orjson": [
+        "orjson",
+    ],
 }
 
 
@@ -13,13 +13,11 @@ class ModelOffsetStore(object):
     def commit(self, consumer, message):
         KafkaOffset = apps.get_model(app_label="logpipe", model_name="KafkaOffset")
         logger.debug(
-            'Commit offset "%s" for topic "%s", partition "%s" to %s'
-            % (
-                message.offset,
-                message.topic,
-                message.partition,
-                self.__class__.__name__,
-            )
+            'Commit offset "%s" for topic "%s", partition "%s" to %s',
+            message.offset,
+            message.topic,
+            message.partition,
+            self.__class__.__name__,
         )
         obj, created = KafkaOffset.objects.get_or_create(
             topic=message.topic, partition=message.partition
@@ -33,28 +31,32 @@ class ModelOffsetStore(object):
         try:
             obj = KafkaOffset.objects.get(topic=topic, partition=partition)
             logger.debug(
-                'Seeking to offset "%s" on topic "%s", partition "%s"'
-                % (obj.offset, topic, partition)
+                'Seeking to offset "%s" on topic "%s", partition "%s"',
+                obj.offset,
+                topic,
+                partition,
             )
             consumer.client.seek(tp, obj.offset)
         except KafkaOffset.DoesNotExist:
             logger.debug(
-                'Seeking to beginning of topic "%s", partition "%s"'
-                % (topic, partition)
+                'Seeking to beginning of topic "%s", partition "%s"',
+                topic,
+                partition,
             )
             consumer.client.seek_to_beginning(tp)
 
 
 class KafkaOffsetStore(object):
+    # Offsets are committed through the consumer's client, which can't be shared with a prefetch thread
+    supports_prefetch = False
+
     def commit(self, consumer, message):
         logger.debug(
-            'Commit offset "%s" for topic "%s", partition "%s" to %s'
-            % (
-                message.offset,
-                message.topic,
-                message.partition,
-                self.__class__.__name__,
-            )
+            'Commit offset "%s" for topic "%s", partition "%s" to %s',
+            message.offset,
+            message.topic,
+            message.partition,
+            self.__class__.__name__,
         )
         consumer.client.commit()
 
@@ -145,6 +147,25 @@ class Producer(object):
             topic=topic_name, partition=metadata.partition, offset=metadata.offset
         )
 
+    def send_many(self, topic_name, records):
+        # Queue every record before waiting on any of them, so the client can batch them together
+        timeout = settings.get("KAFKA_SEND_TIMEOUT", 10)
+        futures = []
+        for key, value in records:
+            if isinstance(key, str):
+                key = key.encode()
+            futures.append(self.client.send(topic_name, key=key, value=value))
+        self.client.flush(timeout=timeout)
+        results = []
+        for future in futures:
+            metadata = future.get(timeout=timeout)
+            results.append(
+                RecordMetadata(
+                    topic=topic_name, partition=metadata.partition, offset=metadata.offset
+                )
+            )
+        return results
+
     def _get_client_config(self):
         servers = settings.get("KAFKA_BOOTSTRAP_SERVERS")
         retries = settings.get("KAFKA_MAX_SEND_RETRIES", 0)
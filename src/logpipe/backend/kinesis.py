@@ -32,14 +32,12 @@ class ModelOffsetStore(object):
         KinesisOffset = apps.get_model(app_label="logpipe", model_name="KinesisOffset")
         region = settings.get_aws_region()
         logger.debug(
-            'Commit offset "%s" for region "%s", stream "%s", shard "%s" to %s'
-            % (
-                message.offset,
-                region,
-                message.topic,
-                message.partition,
-                self.__class__.__name__,
-            )
+            'Commit offset "%s" for region "%s", stream "%s", shard "%s" to %s',
+            message.offset,
+            region,
+            message.topic,
+            message.partition,
+            self.__class__.__name__,
         )
         obj, created = KinesisOffset.objects.get_or_create(
             region=region, stream=message.topic, shard=message.partition
@@ -55,14 +53,19 @@ class ModelOffsetStore(object):
                 region=settings.get_aws_region(), stream=stream, shard=shard
             )
             logger.debug(
-                'Seeking to offset "%s" on region "%s", stream "%s", partition "%s"'
-                % (obj.sequence_number, region, stream, shard)
+                'Seeking to offset "%s" on region "%s", stream "%s", partition "%s"',
+                obj.sequence_number,
+                region,
+                stream,
+                shard,
             )
             consumer.seek_to_sequence_number(shard, obj.sequence_number)
         except KinesisOffset.DoesNotExist:
             logger.debug(
-                'Seeking to beginning of region "%s", stream "%s", partition "%s"'
-                % (region, stream, shard)
+                'Seeking to beginning of region "%s", stream "%s", partition "%s"',
+                region,
+                stream,
+                shard,
             )
             consumer.seek_to_sequence_number(shard, None)
 
@@ -77,7 +80,7 @@ class Consumer(KinesisBase):
         self.shard_iters = {}
 
         shards = self._list_shard_ids()
-        logger.debug("Found {} kinesis shards.".format(len(shards)))
+        logger.debug("Found %s kinesis shards.", len(shards))
         backend = get_offset_backend()
         for shard in shards:
             self.shards.append(shard)
@@ -134,9 +137,7 @@ class Consumer(KinesisBase):
             return 0
 
         # Fetch the records from Kinesis
-        logger.debug(
-            "Loading page of records from {}.{}".format(self.topic_name, shard)
-        )
+        logger.debug("Loading page of records from %s.%s", self.topic_name, shard)
         fetch_limit = settings.get("KINESIS_FETCH_LIMIT", 25)
         response = self._get_records(shard_iter, fetch_limit)
         if response is None:
@@ -149,9 +150,11 @@ class Consumer(KinesisBase):
         else:
             current_stream_lag = 0 if num_records == 0 else 1
         logger.debug(
-            "Loaded {} records from {}.{}. Currently {}ms behind stream head.".format(
-                num_records, self.topic_name, shard, current_stream_lag
-            )
+            "Loaded %s records from %s.%s. Currently %sms behind stream head.",
+            num_records,
+            self.topic_name,
+            shard,
+            current_stream_lag,
         )
 
         # Add the records page into the queue
@@ -175,9 +178,9 @@ class Consumer(KinesisBase):
             self.shards.append(shard)
         else:
             logger.info(
-                "Shard {}.{} has been closed. Removing it from the fetch pool.".format(
-                    self.topic_name, shard
-                )
+                "Shard %s.%s has been closed. Removing it from the fetch pool.",
+                self.topic_name,
+                shard,
             )
 
         return current_stream_lag
@@ -201,13 +204,13 @@ class Consumer(KinesisBase):
                     time.sleep(5)
                 else:
                     logger.warning(
-                        "Received {} from AWS API: {}".format(
-                            e.response["Error"]["Code"], e.response["Error"]["Message"]
-                        )
+                        "Received %s from AWS API: %s",
+                        e.response["Error"]["Code"],
+                        e.response["Error"]["Message"],
                     )
             i += 1
         logger.warning(
-            "After {} attempts, couldn't get records from Kinesis. Giving up.".format(i)
+            "After %s attempts, couldn't get records from Kinesis. Giving up.", i
         )
         return None
 
@@ -257,11 +260,11 @@ class Producer(KinesisBase):
                     time.sleep(5)
                 else:
                     logger.warning(
-                        "Received {} from AWS API: {}".format(
-                            e.response["Error"]["Code"], e.response["Error"]["Message"]
-                        )
+                        "Received %s from AWS API: %s",
+                        e.response["Error"]["Code"],
+                        e.response["Error"]["Message"],
                     )
             i += 1
         logger.warning(
-            "After {} attempts, couldn't send message to Kinesis. Giving up.".format(i)
+            "After %s attempts, couldn't send message to Kinesis. Giving up.", i
         )
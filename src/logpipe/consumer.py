@@ -1,6 +1,11 @@
-from django.db import transaction
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import models, transaction
+from django.db.models.signals import pre_save, post_save
+from django.dispatch import receiver
 from rest_framework.exceptions import ValidationError
-from rest_framework.serializers import Serializer
+from rest_framework.serializers import ModelSerializer, Serializer
+from rest_framework.utils import model_meta
 from .exceptions import (
     InvalidMessageError,
     IgnoredMessageTypeError,
@@ -8,75 +13,150 @@ from .exceptions import (
     UnknownMessageVersionError,
 )
 from .backend import get_offset_backend, get_consumer_backend, get_producer_backend
-from .format import parse, render, _delim
+from .format import render, _parse
+from .prefetch import PrefetchingConsumer, _get_min_lag_wait
 from . import settings, FORMAT_JSON
+from collections import namedtuple
+from enum import Enum
 import itertools
 import logging
+import threading
 import time
+import weakref
 
 logger = logging.getLogger(__name__)
 
 
+# Per-serializer class metadata, computed once when the class is registered with a consumer
+SerializerSpec = namedtuple(
+    "SerializerSpec", ["cls", "is_serializer", "has_lookup", "poolable", "message_type", "version"]
+)
+
+
+def _is_poolable(serializer_class):
+    """
+    Return True if a single instance of the given serializer class can be reused for every message,
+    rather than constructing (and binding the fields of) a new serializer each time. This is only
+    assumed to be safe for serializers which don't override the methods that typically keep state,
+    or which build their fields from the instance being serialized.
+    """
+    if not isinstance(serializer_class, type) or not issubclass(serializer_class, Serializer):
+        return False
+    base = ModelSerializer if issubclass(serializer_class, ModelSerializer) else Serializer
+    for name in ("__init__", "get_fields", "to_internal_value", "run_validation", "validate", "create", "update", "save"):
+        if getattr(serializer_class, name) is not getattr(base, name):
+            return False
+    return True
+
+
+class ResultKind(Enum):
+    OK = "ok"
+    INVALID = "invalid"
+    IGNORED = "ignored"
+    UNKNOWN_TYPE = "unknown_type"
+    UNKNOWN_VERSION = "unknown_version"
+    VALIDATION = "validation"
+
+
+# Outcome of unserializing a message. For anything but ``ResultKind.OK``, ``serializer`` may be
+# ``None`` and ``detail`` describes why the message was skipped.
+Result = namedtuple("Result", ["kind", "message", "serializer", "detail"])
+
+
+# Log level and message used by consumer_error_handler for each kind of skipped message, and the
+# exception raised for it when errors are thrown instead.
+_SKIPPED_RESULTS = {
+    ResultKind.INVALID: (
+        logging.ERROR,
+        "Failed to deserialize message in topic %s. Details: %s",
+        InvalidMessageError,
+    ),
+    ResultKind.IGNORED: (
+        logging.DEBUG,
+        "Skipping ignored message type in topic %s. Details: %s",
+        IgnoredMessageTypeError,
+    ),
+    ResultKind.UNKNOWN_TYPE: (
+        logging.ERROR,
+        "Skipping unknown message type in topic %s. Details: %s",
+        UnknownMessageTypeError,
+    ),
+    ResultKind.UNKNOWN_VERSION: (
+        logging.ERROR,
+        "Skipping unknown message version in topic %s. Details: %s",
+        UnknownMessageVersionError,
+    ),
+    ResultKind.VALIDATION: (
+        logging.WARNING,
+        "Skipping invalid message in topic %s. Details: %s",
+        ValidationError,
+    ),
+}
+
+
+def _get_result_kind(error):
+    """Return the kind of skipped :class:`Result` which corresponds to the given exception, if any."""
+    for kind, (level, log_message, exc_class) in _SKIPPED_RESULTS.items():
+        if isinstance(error, exc_class):
+            return kind
+    return None
+
+
+def _get_bulk_many_fields(serializer_class):
+    """
+    Return the names of the to-many relation fields of the given serializer's model, or ``None`` if
+    messages for the serializer can't be bulk saved. Bulk saving skips ``Model.save()`` and the
+    ``pre_save`` / ``post_save`` signals, so it's only used for plain ``ModelSerializer`` subclasses.
+    """
+    if not isinstance(serializer_class, type) or not issubclass(serializer_class, ModelSerializer):
+        return None
+    for name in ("save", "create", "update"):
+        if getattr(serializer_class, name) is not getattr(ModelSerializer, name):
+            return None
+    model = serializer_class.Meta.model
+    if model.save is not models.Model.save:
+        return None
+    if pre_save.has_listeners(model) or post_save.has_listeners(model):
+        return None
+    info = model_meta.get_field_info(model)
+    return set(name for name, relation in info.relations.items() if relation.to_many)
+
+
 def consumer_error_handler(inner):
 
     while True:
         # Try to get the next message
         try:
-            yield next(inner)
+            result = inner._get_next_result()
 
         # Obey the laws of StopIteration
         except StopIteration:
+            inner._flush_commits()
             return
 
-        # Message format was invalid in some way: log error and move on.
-        except InvalidMessageError as e:
-            logger.error(
-                "Failed to deserialize message in topic {}. Details: {}".format(
-                    inner.consumer.topic_name, e
-                )
-            )
-            inner.commit(e.message)
-
-        # Message type has been explicitly ignored: skip it silently and move on.
-        except IgnoredMessageTypeError as e:
-            logger.debug(
-                "Skipping ignored message type in topic {}. Details: {}".format(
-                    inner.consumer.topic_name, e
-                )
-            )
-            inner.commit(e.message)
+        if result.kind is ResultKind.OK:
+            yield result.message, result.serializer
+            continue
 
-        # Message type is unknown: log error and move on.
-        except UnknownMessageTypeError as e:
-            logger.error(
-                "Skipping unknown message type in topic {}. Details: {}".format(
-                    inner.consumer.topic_name, e
-                )
-            )
-            inner.commit(e.message)
+        # Message couldn't be unserialized: log it at the appropriate level and move on.
+        inner._skip_message(result)
 
-        # Message version is unknown: log error and move on.
-        except UnknownMessageVersionError as e:
-            logger.error(
-                "Skipping unknown message version in topic {}. Details: {}".format(
-                    inner.consumer.topic_name, e
-                )
-            )
-            inner.commit(e.message)
 
-        # Serializer for message type flagged message as invalid: log warning and move on.
-        except ValidationError as e:
-            logger.warning(
-                "Skipping invalid message in topic {}. Details: {}".format(
-                    inner.consumer.topic_name, e
-                )
-            )
-            inner.commit(e.message)
-        pass
+def _result_error(result):
+    """
+    Build the exception which is raised for an unsuccessful :class:`Result` when the consumer is
+    iterated with ``throw_errors=True``.
+    """
+    exc_class = _SKIPPED_RESULTS[result.kind][2]
+    e = exc_class(result.detail)
+    e.message = result.message
+    return e
 
 
 class Consumer(object):
     _client = None
+    # Every live consumer, so that their cached settings can be refreshed
+    _instances = weakref.WeakSet()
 
     def __init__(self, topic_name, throw_errors=False, **kwargs):
         self.consumer = get_consumer_backend(topic_name, **kwargs)
@@ -84,10 +164,58 @@ class Consumer(object):
         self.serializer_classes = {}
         self.custom_classes = {}
         self.ignored_message_types = set([])
-        self.error_topic = settings.get('ERROR_TOPIC', None)
         self.producer_client = None
-        if self.error_topic:
+        self._prefetcher = None
+        self._fetcher = self.consumer
+        prefetch_depth = settings.get("PREFETCH_DEPTH", 0)
+        if prefetch_depth > 0:
+            offset_backend = get_offset_backend()
+            if not getattr(offset_backend, "supports_prefetch", True):
+                raise ImproperlyConfigured(
+                    "PREFETCH_DEPTH can not be used with %s, since it commits offsets through the consumer backend's client."
+                    % offset_backend.__class__.__name__
+                )
+            self._prefetcher = PrefetchingConsumer(self.consumer, prefetch_depth)
+            self._fetcher = self._prefetcher
+        self._pending_commits = {}
+        self._pending_commit_count = 0
+        self._last_commit_time = time.monotonic()
+        self._bulk_many_fields = {}
+        # Messages waiting to be applied in a single transaction, keyed by message key
+        self._batch = {}
+        # (model, pk) of the existing instances which the batched messages write to
+        self._batch_instances = set()
+        # Reusable serializer instances, keyed by class. Only used while run() is processing messages
+        # one at a time, since nothing else holds on to a serializer after its message is processed.
+        self._serializer_pool = {}
+        self._pool_serializers = False
+        self._load_settings()
+        Consumer._instances.add(self)
+
+    @classmethod
+    def refresh_settings(cls):
+        """
+        Re-read the ``LOGPIPE`` settings into every existing consumer. Settings are read once when
+        a consumer is created rather than for every message. This is called automatically when the
+        ``LOGPIPE`` setting is changed (e.g. by ``override_settings``). ``PREFETCH_DEPTH`` only
+        applies to consumers created after the change.
+        """
+        for consumer in list(cls._instances):
+            consumer._load_settings()
+
+    def _load_settings(self):
+        self.error_topic = settings.get('ERROR_TOPIC', '')
+        if self.error_topic and self.producer_client is None:
             self.producer_client = get_producer_backend()
+        self._commit_every_n = settings.get("COMMIT_EVERY_N", 1)
+        self._commit_every_ms = settings.get("COMMIT_EVERY_MS", 0)
+        self._bulk_size = settings.get("BULK_SIZE", 0)
+        self._txn_batch_size = settings.get("TXN_BATCH_SIZE", 1)
+        self._batch_size = max(self._bulk_size, self._txn_batch_size)
+        self._min_lag_ms = settings.get("MIN_MESSAGE_LAG_MS", 0)
+        if self._prefetcher:
+            # Messages are held back by the fetch thread instead of the processing thread
+            self._prefetcher.min_lag_ms = self._min_lag_ms
 
     def add_ignored_message_type(self, message_type):
         self.ignored_message_types.add(message_type)
@@ -95,55 +223,208 @@ class Consumer(object):
     def commit(self, message):
         get_offset_backend().commit(self.consumer, message)
 
+    def close(self):
+        self._flush_commits()
+        if self._prefetcher:
+            self._prefetcher.close()
+
     def register(self, serializer_class):
         message_type = serializer_class.MESSAGE_TYPE
         version = serializer_class.VERSION
+        is_serializer = isinstance(serializer_class, type) and issubclass(serializer_class, Serializer)
+        spec = SerializerSpec(
+            cls=serializer_class,
+            is_serializer=is_serializer,
+            has_lookup=is_serializer and hasattr(serializer_class, "lookup_instance"),
+            poolable=_is_poolable(serializer_class),
+            message_type=message_type,
+            version=version,
+        )
         if message_type not in self.serializer_classes:
             self.serializer_classes[message_type] = {}
-        self.serializer_classes[message_type][version] = serializer_class
+        self.serializer_classes[message_type][version] = spec
 
-    def send_message_to_error_topic(self, message, error):
-        data = parse(message.value)
+    def send_message_to_error_topic(self, message, error, serializer=None):
+        # Reuse the data parsed by _unserialize, if there is any
+        data = getattr(serializer, '_message_data', None)
+        if data is None:
+            code, data = _parse(message.value)
+        else:
+            code = serializer._message_format
         data['error'] = error
         data['can_retry'] = True
-        code, _ = message.value.split(_delim, 1)
         message_value = render(code, data)
         self.producer_client.send(
             self.error_topic, key=message.key, value=message_value
         )
-        self.commit(message)
+        self._defer_commit(message)
 
     def run(self, iter_limit=0):
+        try:
+            self._run(iter_limit)
+        finally:
+            self._flush_commits()
+
+    def _run(self, iter_limit):
         i = 0
-        for message, serializer in self:
+        batch = self._batch
+        self._pool_serializers = self._batch_size <= 1
+        try:
+            for message, serializer in self:
+                instance_key = self._get_instance_key(serializer)
+                if message.key in batch or instance_key in self._batch_instances:
+                    # A batched message refers to the same key or instance, so apply it first and then
+                    # redo this message's instance lookup and validation against the updated database.
+                    self._apply_batch(batch)
+                    self._process_message(message)
+                else:
+                    bulk = self._can_bulk_save(message, serializer)
+                    if message.key is not None and (bulk or self._txn_batch_size > 1):
+                        batch[message.key] = (message, serializer, bulk)
+                        if instance_key is not None:
+                            self._batch_instances.add(instance_key)
+                        if len(batch) >= self._batch_size:
+                            self._apply_batch(batch)
+                    else:
+                        self._apply_batch(batch)
+                        self._process_message(message, serializer)
+                i += 1
+                if iter_limit > 0 and i >= iter_limit:
+                    break
+        finally:
+            self._pool_serializers = False
+            self._apply_batch(batch)
+
+    def _process_message(self, message, serializer=None):
+        with transaction.atomic():
+            try:
+                if serializer is None:
+                    # Redo the instance lookup and validation against the current database
+                    result = self._try_unserialize(message)
+                    if result.kind is not ResultKind.OK:
+                        self._skip_message(result)
+                        return
+                    serializer = result.serializer
+                self._dispatch(serializer)
+                self._defer_commit(message)
+            except Exception as e:
+                logger.exception(
+                    'Failed to process message with key "%s" from topic "%s", partition "%s", offset "%s"',
+                    message.key,
+                    message.topic,
+                    message.partition,
+                    message.offset,
+                )
+                if self.error_topic:
+                    self.send_message_to_error_topic(message, str(e), serializer)
+                else:
+                    raise e
+
+    def _skip_message(self, result):
+        if self.throw_errors:
+            raise _result_error(result)
+        level, log_message, exc_class = _SKIPPED_RESULTS[result.kind]
+        logger.log(level, log_message, self.consumer.topic_name, result.detail)
+        self._defer_commit(result.message)
+
+    def _dispatch(self, serializer):
+        action_type = getattr(serializer, '_action_type', 'save')
+        if action_type == 'delete':
+            serializer.delete() if hasattr(serializer, 'delete') else serializer.instance.delete()
+        elif action_type == 'save':
+            serializer.save()
+        elif action_type == 'class':
+            serializer.receive()
+
+    def _apply_batch(self, batch):
+        if not batch:
+            return
+        items = list(batch.values())
+        batch.clear()
+        self._batch_instances.clear()
+        if len(items) == 1:
+            message, serializer, bulk = items[0]
+            self._process_message(message, serializer)
+            return
+        try:
             with transaction.atomic():
-                try:
-                    action_type = getattr(serializer, '_action_type', 'save')
-                    if action_type == 'delete':
-                        serializer.delete() if hasattr(serializer, 'delete') else serializer.instance.delete()
-                    elif action_type == 'save':
-                        serializer.save()
-                    elif action_type == 'class':
-                        serializer.receive()
-                    self.commit(message)
-                except Exception as e:
-                    info = (
-                        message.key,
-                        message.topic,
-                        message.partition,
-                        message.offset,
-                    )
-                    logger.exception(
-                        'Failed to process message with key "%s" from topic "%s", partition "%s", offset "%s"'
-                        % info
-                    )
-                    if self.error_topic:
-                        self.send_message_to_error_topic(message, str(e))
+                # Runs of bulk-saveable messages for the same serializer are written together
+                groups = itertools.groupby(items, key=lambda item: type(item[1]) if item[2] else None)
+                for serializer_class, group in groups:
+                    if serializer_class is None:
+                        for message, serializer, bulk in group:
+                            self._dispatch(serializer)
                     else:
-                        raise e
-            i += 1
-            if iter_limit > 0 and i >= iter_limit:
-                break
+                        self._bulk_save([serializer for message, serializer, bulk in group])
+                # Offsets are committed in the same transaction as the rows they correspond to
+                for message, serializer, bulk in items:
+                    self._defer_commit(message)
+        except Exception:
+            logger.exception(
+                "Failed to apply batch of %s messages from topic %s. Retrying them one at a time.",
+                len(items),
+                self.consumer.topic_name,
+            )
+            for message, serializer, bulk in items:
+                self._process_message(message)
+
+    def _get_instance_key(self, serializer):
+        instance = getattr(serializer, 'instance', None)
+        pk = getattr(instance, 'pk', None)
+        if pk is None:
+            return None
+        return (type(instance), pk)
+
+    def _can_bulk_save(self, message, serializer):
+        if self._bulk_size < 2 or message.key is None:
+            return False
+        if getattr(serializer, '_action_type', 'save') != 'save':
+            return False
+        serializer_class = type(serializer)
+        if serializer_class not in self._bulk_many_fields:
+            self._bulk_many_fields[serializer_class] = _get_bulk_many_fields(serializer_class)
+        many_fields = self._bulk_many_fields[serializer_class]
+        return many_fields is not None and many_fields.isdisjoint(serializer.validated_data)
+
+    def _bulk_save(self, serializers):
+        model = type(serializers[0]).Meta.model
+        created, updated, update_fields = [], [], set()
+        for serializer in serializers:
+            validated_data = serializer.validated_data
+            if serializer.instance is None:
+                serializer.instance = model(**validated_data)
+                created.append(serializer.instance)
+            else:
+                for attr, value in validated_data.items():
+                    setattr(serializer.instance, attr, value)
+                updated.append(serializer.instance)
+                update_fields.update(validated_data)
+        # bulk_update() refuses to update primary keys, and the instances were looked up by them anyway
+        update_fields.discard(model._meta.pk.name)
+        if created:
+            model._default_manager.bulk_create(created, batch_size=self._bulk_size)
+        if updated and update_fields:
+            model._default_manager.bulk_update(updated, update_fields, batch_size=self._bulk_size)
+
+    def _defer_commit(self, message):
+        # Only the most recent message of each partition needs to be committed
+        self._pending_commits[(message.topic, message.partition)] = message
+        self._pending_commit_count += 1
+        if self._pending_commit_count >= self._commit_every_n:
+            self._flush_commits()
+        elif self._commit_every_ms > 0:
+            elapsed_ms = (time.monotonic() - self._last_commit_time) * 1000
+            if elapsed_ms >= self._commit_every_ms:
+                self._flush_commits()
+
+    def _flush_commits(self):
+        if self._pending_commits:
+            with transaction.atomic(savepoint=False):
+                for message in self._pending_commits.values():
+                    self.commit(message)
+            self._pending_commits = {}
+        self._pending_commit_count = 0
+        self._last_commit_time = time.monotonic()
 
     def __iter__(self):
         if self.throw_errors:
@@ -157,89 +438,157 @@ class Consumer(object):
         return '<logpipe.consumer.Consumer topic="%s">' % self.consumer.topic_name
 
     def _get_next_message(self):
-        message = next(self.consumer)
+        result = self._get_next_result()
+        if result.kind is not ResultKind.OK:
+            raise _result_error(result)
+        return result.message, result.serializer
+
+    def _get_next_result(self):
+        message = next(self._fetcher)
 
-        info = (message.key, message.topic, message.partition, message.offset)
         logger.debug(
-            'Received message with key "%s" from topic "%s", partition "%s", offset "%s"'
-            % info
+            'Received message with key "%s" from topic "%s", partition "%s", offset "%s"',
+            message.key,
+            message.topic,
+            message.partition,
+            message.offset,
         )
 
-        # Wait?
-        timestamp = getattr(message, "timestamp", None) or (time.time() * 1000)
-        lag_ms = (time.time() * 1000) - timestamp
-        logger.debug("Message lag is %sms" % lag_ms)
-        wait_ms = settings.get("MIN_MESSAGE_LAG_MS", 0) - lag_ms
-        if wait_ms > 0:
-            logger.debug("Respecting MIN_MESSAGE_LAG_MS by waiting %sms" % wait_ms)
-            time.sleep(wait_ms / 1000)
-            logger.debug("Finished waiting")
+        # Wait? When prefetching, the fetch thread has already waited.
+        if self._min_lag_ms > 0 and self._prefetcher is None:
+            self._wait_for_min_lag(message)
+
+        result = self._try_unserialize(message)
+        if result.kind is not ResultKind.OK and self._batch:
+            # The batched messages before this one must be written before its offset is committed.
+            # Doing that first may also make it valid, if it refers to rows they create.
+            self._apply_batch(self._batch)
+            if result.kind is ResultKind.VALIDATION:
+                result = self._try_unserialize(message)
+        return result
 
+    def _try_unserialize(self, message):
         try:
-            serializer = self._unserialize(message)
+            return self._unserialize_result(message)
         except Exception as e:
             e.message = message
-            raise e
-
-        return message, serializer
+            # Errors raised by user code (e.g. a serializer's lookup_instance) are skipped the same
+            # way as the results they correspond to, unless errors are being thrown.
+            kind = None if self.throw_errors else _get_result_kind(e)
+            if kind is None:
+                raise e
+            return Result(kind, message, None, e)
+
+    def _wait_for_min_lag(self, message):
+        wait = _get_min_lag_wait(message, self._min_lag_ms, time.time() * 1000)
+        if wait > 0:
+            time.sleep(wait)
+            logger.debug("Finished waiting")
 
-    def _unserialize(self, message):
-        data = parse(message.value)
+    def _unserialize_result(self, message):
+        code, data = _parse(message.value)
         if "type" not in data:
-            raise InvalidMessageError(
-                'Received message missing missing a top-level "type" key.'
-            )
+            return Result(ResultKind.INVALID, message, None, 'Received message missing missing a top-level "type" key.')
         if "version" not in data:
-            raise InvalidMessageError(
-                'Received message missing missing a top-level "version" key.'
-            )
+            return Result(ResultKind.INVALID, message, None, 'Received message missing missing a top-level "version" key.')
         if "message" not in data:
-            raise InvalidMessageError(
-                'Received message missing missing a top-level "message" key.'
-            )
+            return Result(ResultKind.INVALID, message, None, 'Received message missing missing a top-level "message" key.')
 
         message_type = data["type"]
-        action_type = data.get('action_type', 'save')
         if message_type in self.ignored_message_types:
-            raise IgnoredMessageTypeError(
-                'Received message with ignored type "%s" in topic %s'
-                % (message_type, message.topic)
+            return Result(
+                ResultKind.IGNORED,
+                message,
+                None,
+                'Received message with ignored type "%s" in topic %s' % (message_type, message.topic),
             )
-        if message_type not in self.serializer_classes:
-            raise UnknownMessageTypeError(
-                'Received message with unknown type "%s" in topic %s'
-                % (message_type, message.topic)
+        versions = self.serializer_classes.get(message_type)
+        if versions is None:
+            return Result(
+                ResultKind.UNKNOWN_TYPE,
+                message,
+                None,
+                'Received message with unknown type "%s" in topic %s' % (message_type, message.topic),
             )
 
         version = data["version"]
-        if version not in self.serializer_classes[message_type]:
-            raise UnknownMessageVersionError(
-                'Received message of type "%s" with unknown version "%s" in topic %s'
-                % (message_type, version, message.topic)
+        spec = versions.get(version)
+        if spec is None:
+            return Result(
+                ResultKind.UNKNOWN_VERSION,
+                message,
+                None,
+                'Received message of type "%s" with unknown version "%s" in topic %s' % (message_type, version, message.topic),
             )
 
-        serializer_class = self.serializer_classes[message_type][version]
-        is_serializer = issubclass(serializer_class, Serializer)
+        body = data["message"]
+        action_type = data.get('action_type', 'save')
+        serializer_class = spec.cls
         instance = None
-        if hasattr(serializer_class, "lookup_instance") and is_serializer:
-            instance = serializer_class.lookup_instance(**data["message"])
+        if spec.has_lookup:
+            instance = serializer_class.lookup_instance(**body)
         if action_type == 'save':
-            serializer = serializer_class(instance=instance, data=data["message"])
-            serializer.is_valid(raise_exception=True)
+            serializer = self._get_serializer(spec, instance=instance, data=body)
+            if not serializer.is_valid():
+                return Result(ResultKind.VALIDATION, message, serializer, serializer.errors)
         elif action_type == 'delete':
-            serializer = serializer_class(instance=instance)
+            serializer = self._get_serializer(spec, instance=instance)
         elif action_type == 'class':
-            serializer = serializer_class(data=data["message"])
+            serializer = self._get_serializer(spec, data=body)
         else:
             raise NotImplementedError("Can't use this action type")
         serializer._action_type = action_type
+        serializer._message_format = code
+        serializer._message_data = data
+        return Result(ResultKind.OK, message, serializer, None)
+
+    def _get_serializer(self, spec, **kwargs):
+        if not (spec.poolable and self._pool_serializers):
+            return spec.cls(**kwargs)
+        serializer = self._serializer_pool.get(spec.cls)
+        if serializer is None:
+            serializer = spec.cls(**kwargs)
+            self._serializer_pool[spec.cls] = serializer
+            return serializer
+        # Reset the pooled serializer to the state it would have been constructed in, keeping its
+        # already bound fields.
+        serializer.instance = kwargs.get("instance")
+        serializer.__dict__.pop("initial_data", None)
+        if "data" in kwargs:
+            serializer.initial_data = kwargs["data"]
+        for attr in ("_validated_data", "_errors", "_data"):
+            serializer.__dict__.pop(attr, None)
         return serializer
 
 
+@receiver(setting_changed)
+def _refresh_consumer_settings(setting, **kwargs):
+    if setting == "LOGPIPE":
+        Consumer.refresh_settings()
+
+
 class MultiConsumer(object):
-    def __init__(self, *consumers):
+    def __init__(self, *consumers, budget=100):
         self.consumers = consumers
+        self.budget = budget
 
     def run(self):
-        for consumer in itertools.cycle(self.consumers):
-            consumer.run(iter_limit=1)
+        if not all(consumer._prefetcher for consumer in self.consumers):
+            # Consumers fetch in the foreground, so take turns processing one message each
+            for consumer in itertools.cycle(self.consumers):
+                consumer.run(iter_limit=1)
+
+        # Every consumer is fetching in the background, so only run the ones which have messages
+        # waiting, up to `budget` messages each, and sleep until a fetch thread wakes us otherwise.
+        wakeup = threading.Event()
+        for consumer in self.consumers:
+            consumer._prefetcher.block = False
+            consumer._prefetcher.wakeup = wakeup
+        while True:
+            wakeup.clear()
+            ready = [consumer for consumer in self.consumers if consumer._prefetcher.ready()]
+            if not ready:
+                wakeup.wait(timeout=1)
+                continue
+            for consumer in ready:
+                consumer.run(iter_limit=self.budget)
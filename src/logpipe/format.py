@@ -26,21 +26,31 @@ def unregister(code):
 
 
 def render(code, data):
+    code = _bytes(code)
+    return code + _delim + _render(code, data)
+
+
+def _render(code, data):
+    """Render the given data, without prefixing it with the format code."""
     code = _bytes(code)
     if code not in _formats:
         raise UnknownFormatError(
             "Could not find renderer for format %s" % code.decode()
         )
-    body = _formats[code]["renderer"].render(data)
-    return code + _delim + body
+    return _formats[code]["renderer"].render(data)
 
 
 def parse(data):
+    return _parse(data)[1]
+
+
+def _parse(data):
+    """Parse the given message, returning a tuple of its format code and its parsed data."""
     data = _bytes(data)
     code, body = data.split(_delim, 1)
     if code not in _formats:
         raise UnknownFormatError("Could not find parser for format %s" % code.decode())
-    return _formats[code]["parser"].parse(BytesIO(body))
+    return code, _formats[code]["parser"].parse(BytesIO(body))
 
 
 __all__ = ["register", "unregister", "render", "parse"]
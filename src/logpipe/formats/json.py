@@ -1,5 +1,78 @@
-from rest_framework.renderers import JSONRenderer
-from rest_framework.parsers import JSONParser
+from django.utils.functional import cached_property
+from rest_framework import renderers, parsers
+from rest_framework.exceptions import ParseError
+from io import BytesIO
+import math
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# orjson parses integers which don't fit in 64 bits as floats. Every such integer has at least 20 digits.
+_big_int = re.compile(rb"\d{20,}")
+
+
+def _has_non_finite_float(data):
+    if isinstance(data, float):
+        return not math.isfinite(data)
+    if isinstance(data, dict):
+        return any(_has_non_finite_float(value) for value in data.values())
+    if isinstance(data, (list, tuple)):
+        return any(_has_non_finite_float(value) for value in data)
+    return False
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    """
+    JSON renderer which uses ``orjson`` when it's installed, falling back to
+    Django REST Framework's stdlib based renderer otherwise.
+    """
+
+    @cached_property
+    def _default(self):
+        return self.encoder_class().default
+
+    def render(self, data, media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, media_type, renderer_context)
+        try:
+            # Datetimes are passed through to DRF's encoder, so they're formatted the same way
+            # (e.g. "Z" instead of "+00:00" for UTC) regardless of which renderer is used.
+            rendered = orjson.dumps(
+                data,
+                default=self._default,
+                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+            )
+        except orjson.JSONEncodeError:
+            # Some values (e.g. integers larger than 64 bits) can't be handled by orjson.
+            return super().render(data, media_type, renderer_context)
+        # orjson renders NaN and infinity as null, so let DRF's renderer handle (and by default,
+        # reject) them instead. The data is only searched when the output contains a null.
+        if b"null" in rendered and _has_non_finite_float(data):
+            return super().render(data, media_type, renderer_context)
+        return rendered
+
+
+class JSONParser(parsers.JSONParser):
+    """
+    JSON parser which uses ``orjson`` when it's installed, falling back to
+    Django REST Framework's stdlib based parser otherwise.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        data = stream.read()
+        if _big_int.search(data):
+            # Keep big integers exact by letting DRF's stdlib based parser handle them.
+            return super().parse(BytesIO(data), media_type, parser_context)
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError as exc:
+            raise ParseError("JSON parse error - %s" % str(exc))
 
 
 __all__ = ["JSONRenderer", "JSONParser"]
@@ -0,0 +1,148 @@
+from django.db import connections
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# Queue marker signalling that the underlying consumer raised StopIteration.
+_END = object()
+
+
+def _get_min_lag_wait(message, min_lag_ms, now_ms):
+    """
+    Return the number of seconds to wait until the given message is at least ``min_lag_ms`` old.
+    Messages without a timestamp are treated as brand new.
+    """
+    timestamp = getattr(message, "timestamp", None) or now_ms
+    lag_ms = now_ms - timestamp
+    logger.debug("Message lag is %sms", lag_ms)
+    wait_ms = min_lag_ms - lag_ms
+    if wait_ms <= 0:
+        return 0
+    logger.debug("Respecting MIN_MESSAGE_LAG_MS by waiting %sms", wait_ms)
+    return wait_ms / 1000
+
+
+class PrefetchingConsumer(object):
+    """
+    Wraps a consumer backend and fetches messages from it in a background thread, so that the next
+    broker fetch overlaps with processing of the current message. At most ``depth`` messages are
+    buffered at a time.
+
+    When ``min_lag_ms`` is set, the fetch thread holds each message back until it is at least that
+    old before adding it to the buffer, so the processing thread never has to sleep.
+
+    The backend is iterated exclusively from the background thread, so offset backends which talk
+    to the backend's client (e.g. ``logpipe.backend.kafka.KafkaOffsetStore``) can't be used with
+    prefetching. Such backends set ``supports_prefetch = False``, and ``Consumer`` refuses to
+    prefetch with them.
+    """
+
+    def __init__(self, consumer, depth):
+        self.consumer = consumer
+        self.depth = depth
+        # When False, iteration stops as soon as the buffer is empty instead of waiting for the fetch thread.
+        self.block = True
+        # Optional event which is set whenever a message is added to the buffer.
+        self.wakeup = None
+        # Minimum age, in milliseconds, of messages before they're added to the buffer.
+        self.min_lag_ms = 0
+        self._queue = queue.Queue(maxsize=depth)
+        self._thread = None
+        self._closed = threading.Event()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._closed.is_set():
+            raise StopIteration()
+        if self._thread is None:
+            self._start()
+        try:
+            item = self._queue.get(block=self.block)
+        except queue.Empty:
+            raise StopIteration()
+        if item is _END:
+            # The fetch thread has exited. Start a new one the next time a message is requested.
+            self._thread.join()
+            self._thread = None
+            raise StopIteration()
+        if isinstance(item, BaseException):
+            self._thread.join()
+            self._thread = None
+            raise item
+        return item
+
+    def ready(self):
+        """
+        Return True if a message (or the end of the topic) is waiting in the buffer, making sure the
+        fetch thread is running so that the buffer keeps being filled.
+        """
+        if self._thread is None and not self._closed.is_set():
+            self._start()
+        return not self._queue.empty()
+
+    def close(self):
+        """
+        Stop the fetch thread and drop any buffered messages. Since their offsets haven't been
+        committed yet, they will be fetched again the next time the topic is consumed.
+        """
+        self._closed.set()
+        self._drain()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._drain()
+
+    def _start(self):
+        # Make sure lazily connected backends (and their offset seeking) are set up from the
+        # calling thread, rather than from the fetch thread's own database connection.
+        getattr(self.consumer, "client", None)
+        self._thread = threading.Thread(
+            target=self._fetch,
+            name="logpipe-prefetch-%s" % getattr(self.consumer, "topic_name", ""),
+            daemon=True,
+        )
+        self._thread.start()
+
+    def _fetch(self):
+        try:
+            while not self._closed.is_set():
+                message = next(self.consumer)
+                if self.min_lag_ms > 0:
+                    self._wait_for_min_lag(message)
+                self._put(message)
+        except StopIteration:
+            self._put(_END)
+        except Exception as e:
+            logger.debug("Prefetch thread for %s failed: %s", self.consumer, e)
+            self._put(e)
+        finally:
+            connections.close_all()
+
+    def _wait_for_min_lag(self, message):
+        wait = _get_min_lag_wait(message, self.min_lag_ms, time.time() * 1000)
+        if wait > 0:
+            # Wake up early if the consumer is closed in the meantime
+            self._closed.wait(wait)
+
+    def _put(self, item):
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                if self.wakeup is not None:
+                    self.wakeup.set()
+                return
+            except queue.Full:
+                pass
+
+    def _drain(self):
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                return
@@ -1,59 +1,137 @@
-from typing import Union
-
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 from .backend import get_producer_backend
 from .constants import FORMAT_JSON
-from .format import render
+from .format import render, _render
 from . import settings
+from functools import partial
 import logging
+import operator
+import weakref
 
 logger = logging.getLogger(__name__)
 
 
 class Producer(object):
     _client = None
+    # Every live producer, so that their cached settings can be refreshed
+    _instances = weakref.WeakSet()
 
     def __init__(self, topic_name, serializer_class):
         self.client = get_producer_backend()
         self.topic_name = topic_name
         self.serializer_class = serializer_class
+        self._message_type = serializer_class.MESSAGE_TYPE
+        self._version = serializer_class.VERSION
+        self._key_field = getattr(serializer_class, "KEY_FIELD", None)
+        # Reads the partition key out of a message's data
+        self._get_key = operator.itemgetter(self._key_field) if self._key_field else None
+        self._make_body = partial(dict, type=self._message_type, version=self._version)
+        self._json_envelopes = {}
+        self._load_settings()
+        Producer._instances.add(self)
 
-    def send(self, instance, renderer=None, action_type='save'):
-        # Instantiate the serialize
+    @classmethod
+    def refresh_settings(cls):
+        """
+        Re-read the ``LOGPIPE`` settings into every existing producer. This is called automatically
+        when the ``LOGPIPE`` setting is changed (e.g. by ``override_settings``).
+        """
+        for producer in list(cls._instances):
+            producer._load_settings()
 
-        # Get the message type and version
-        message_type = self.serializer_class.MESSAGE_TYPE
-        version = self.serializer_class.VERSION
+    def _load_settings(self):
+        self._default_format = settings.get("DEFAULT_FORMAT", FORMAT_JSON)
 
-        # Get the message's partition key
-        key_field = getattr(self.serializer_class, "KEY_FIELD", None)
-        key = None
-        ser = None
+    def send(self, instance, renderer=None, action_type='save'):
+        # Serialize the instance once, for both the key and the body
         if action_type == 'save':
-            ser = self.serializer_class(instance=instance)
-            if key_field:
-                key = str(ser.data[key_field])
+            message = self.serializer_class(instance=instance).data
         elif action_type in ['delete', 'class']:
-            if not key_field:
+            if not self._get_key:
                 raise KeyError('Add "key_field" to serializer')
-            key = str(instance[key_field])
+            message = instance
         else:
             raise NotImplementedError('Please specify another action_type, use save/delete/class')
+
+        # Get the message's partition key
+        key = str(self._get_key(message)) if self._get_key else None
+
         # Render everything into a string
-        renderer = settings.get("DEFAULT_FORMAT", FORMAT_JSON)
-        body = {
-            "type": message_type,
-            "version": version,
-            "message": ser.data if ser else instance,
-            "action_type": action_type,
-        }
-        serialized_data = render(renderer, body)
+        renderer = renderer or self._default_format
+        serialized_data = self._render(renderer, message, action_type)
 
         # Send the message data into the backend
         record_metadata = self.client.send(
             self.topic_name, key=key, value=serialized_data
         )
         logger.debug(
-            'Sent message with type "%s", key "%s" to topic "%s"'
-            % (message_type, key, self.topic_name)
+            'Sent message with type "%s", key "%s" to topic "%s"',
+            self._message_type,
+            key,
+            self.topic_name,
         )
         return record_metadata
+
+    def send_many(self, instances, renderer=None, action_type='save'):
+        # Serialize all of the instances at once
+        if action_type == 'save':
+            messages = self.serializer_class(instance=instances, many=True).data
+        elif action_type in ['delete', 'class']:
+            if not self._get_key:
+                raise KeyError('Add "key_field" to serializer')
+            messages = instances
+        else:
+            raise NotImplementedError('Please specify another action_type, use save/delete/class')
+
+        # Render everything into strings
+        renderer = renderer or self._default_format
+        records = []
+        for message in messages:
+            key = str(self._get_key(message)) if self._get_key else None
+            records.append((key, self._render(renderer, message, action_type)))
+
+        # Send the message data into the backend, letting it batch the messages if it supports that
+        send_many = getattr(self.client, "send_many", None)
+        if send_many:
+            record_metadata = send_many(self.topic_name, records)
+        else:
+            record_metadata = [
+                self.client.send(self.topic_name, key=key, value=value)
+                for key, value in records
+            ]
+        logger.debug(
+            'Sent %s messages with type "%s" to topic "%s"',
+            len(records),
+            self._message_type,
+            self.topic_name,
+        )
+        return record_metadata
+
+    def _render(self, renderer, message, action_type):
+        if renderer == FORMAT_JSON and message is not None:
+            if action_type not in self._json_envelopes:
+                self._json_envelopes[action_type] = self._get_json_envelope(action_type)
+            envelope = self._json_envelopes[action_type]
+            if envelope:
+                # Splice the message into the pre-rendered envelope, rather than rendering the
+                # (constant) type, version, and action type on every send.
+                prefix, suffix = envelope
+                return prefix + _render(renderer, message) + suffix
+        body = self._make_body(message=message, action_type=action_type)
+        return render(renderer, body)
+
+    def _get_json_envelope(self, action_type):
+        # Render the envelope with a null message in the last position, then split it around the null.
+        body = self._make_body(action_type=action_type, message=None)
+        rendered = render(FORMAT_JSON, body)
+        placeholder = b"null}"
+        if not rendered.endswith(placeholder):
+            return None
+        return rendered[: -len(placeholder)], b"}"
+
+
+@receiver(setting_changed)
+def _refresh_producer_settings(setting, **kwargs):
+    if setting == "LOGPIPE":
+        Producer.refresh_settings()
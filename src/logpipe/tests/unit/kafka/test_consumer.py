@@ -1,10 +1,15 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
 from django.test import override_settings
 from unittest.mock import MagicMock, patch
 from kafka.consumer.fetcher import ConsumerRecord
 from kafka.structs import TopicPartition
+from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
-from logpipe import Consumer
+from logpipe import Consumer, MultiConsumer
+from logpipe.format import _parse
 from logpipe.exceptions import InvalidMessageError, UnknownMessageVersionError
+from logpipe.models import KinesisOffset
 from logpipe.tests.common import BaseTest, TOPIC_STATES
 import binascii
 
@@ -14,6 +19,57 @@ LOGPIPE = {
 }
 
 
+class ShardSerializer(serializers.ModelSerializer):
+    MESSAGE_TYPE = "shard"
+    VERSION = 1
+    KEY_FIELD = "shard"
+
+    class Meta:
+        model = KinesisOffset
+        fields = ["region", "stream", "shard", "sequence_number"]
+
+    @classmethod
+    def lookup_instance(cls, shard, **kwargs):
+        return KinesisOffset.objects.filter(shard=shard).first()
+
+
+class ChildShardSerializer(ShardSerializer):
+    """Shard whose stream must name a shard which has already been consumed"""
+
+    MESSAGE_TYPE = "child-shard"
+
+    def validate(self, attrs):
+        if not KinesisOffset.objects.filter(shard=attrs["stream"]).exists():
+            raise serializers.ValidationError("Unknown parent shard")
+        return attrs
+
+
+class NewShardSerializer(serializers.ModelSerializer):
+    """Shard serializer without an instance lookup, so existing shards fail validation"""
+
+    MESSAGE_TYPE = "new-shard"
+    VERSION = 1
+
+    class Meta:
+        model = KinesisOffset
+        fields = ["region", "stream", "shard", "sequence_number"]
+
+
+class ShardByIDSerializer(serializers.ModelSerializer):
+    MESSAGE_TYPE = "shard-by-id"
+    VERSION = 1
+    KEY_FIELD = "id"
+    id = serializers.IntegerField()
+
+    class Meta:
+        model = KinesisOffset
+        fields = ["id", "region", "stream", "shard", "sequence_number"]
+
+    @classmethod
+    def lookup_instance(cls, id, **kwargs):
+        return KinesisOffset.objects.filter(id=id).first()
+
+
 class ConsumerTest(BaseTest):
     @override_settings(LOGPIPE=LOGPIPE)
     @patch("kafka.KafkaConsumer")
@@ -64,6 +120,431 @@ class ConsumerTest(BaseTest):
         self.assertEqual(fake_kafka_consumer.__next__.call_count, 2)
         self.assertEqual(self.serializers["state"].save.call_count, 1)
 
+    @override_settings(
+        LOGPIPE=dict(LOGPIPE, PREFETCH_DEPTH=10, OFFSET_BACKEND="logpipe.backend.kafka.KafkaOffsetStore")
+    )
+    @patch("kafka.KafkaConsumer")
+    def test_prefetching_with_kafka_offset_store(self, KafkaConsumer):
+        with self.assertRaises(ImproperlyConfigured):
+            Consumer(TOPIC_STATES, consumer_timeout_ms=500)
+
+    @override_settings(LOGPIPE=dict(LOGPIPE, PREFETCH_DEPTH=10))
+    @patch("kafka.KafkaConsumer")
+    def test_prefetching_consume(self, KafkaConsumer):
+        fake_kafka_consumer = self.mock_consumer(
+            KafkaConsumer,
+            value=b'json:{"message":{"code":"NY","name":"New York"},"version":1,"type":"us-state"}',
+            max_calls=5,
+        )
+        FakeStateSerializer = self.mock_state_serializer()
+
+        consumer = Consumer(TOPIC_STATES, consumer_timeout_ms=500)
+        consumer.register(FakeStateSerializer)
+        consumer.run()
+
+        # All messages are processed, then the end of the topic stops the run loop
+        self.assertEqual(FakeStateSerializer.call_count, 5)
+        self.assertEqual(fake_kafka_consumer.__next__.call_count, 6)
+
+        # Running again starts a new fetch thread
+        consumer.run()
+        self.assertEqual(FakeStateSerializer.call_count, 5)
+        self.assertEqual(fake_kafka_consumer.__next__.call_count, 7)
+        consumer.close()
+
+    @override_settings(LOGPIPE=dict(LOGPIPE, MIN_MESSAGE_LAG_MS=500))
+    @patch("logpipe.consumer.time")
+    @patch("kafka.KafkaConsumer")
+    def test_min_message_lag(self, KafkaConsumer, time):
+        # Message timestamp is 1467649216540, so the message is 200ms old
+        time.time.return_value = 1467649216.740
+        self.mock_consumer(
+            KafkaConsumer,
+            value=b'json:{"message":{"code":"NY","name":"New York"},"version":1,"type":"us-state"}',
+        )
+        FakeStateSerializer = self.mock_state_serializer()
+        consumer = Consumer(TOPIC_STATES, consumer_timeout_ms=500)
+        consumer.register(FakeStateSerializer)
+        consumer.run(iter_limit=1)
+        time.sleep.assert_called_once()
+        self.assertAlmostEqual(time.sleep.call_args[0][0], 0.3)
+
+    @override_settings(LOGPIPE=dict(LOGPIPE, MIN_MESSAGE_LAG_MS=500, PREFETCH_DEPTH=10))
+    @patch("logpipe.prefetch.time")
+    @patch("logpipe.consumer.time")
+    @patch("kafka.KafkaConsumer")
+    def test_prefetching_min_message_lag(self, KafkaConsumer, consumer_time, prefetch_time):
+        # Message timestamp is 1467649216540, so the message is 200ms old
+        prefetch_time.time.return_value = 1467649216.740
+        value = b'json:{"message":{"code":"NY","name":"New York"},"version":1,"type":"us-state"}'
+        self.mock_consumer_records(KafkaConsumer, [(b"NY", value)])
+        FakeStateSerializer = self.mock_state_serializer()
+        consumer = Consumer(TOPIC_STATES, consumer_timeout_ms=500)
+        consumer.register(FakeStateSerializer)
+        closed = consumer._prefetcher._closed
+        closed.wait = MagicMock(wraps=closed.wait)
+        consumer.run()
+        consumer.close()
+
+        # The fetch thread waited before buffering the message, instead of the processing thread
+        consumer_time.sleep.assert_not_called()
+        closed.wait.assert_called_once()
+        self.assertAlmostEqual(closed.wait.call_args[0][0], 0.3)
+        self.assertEqual(FakeStateSerializer.call_count, 1)
+
+    @override_settings(LOGPIPE=LOGPIPE)
+    @patch("kafka.KafkaConsumer")
+    def test_refresh_settings(self, KafkaConsumer):
+        consumer = Consumer(TOPIC_STATES, consumer_timeout_ms=500)
+        self.assertEqual(consumer._min_lag_ms, 0)
+        self.assertEqual(consumer._batch_size, 1)
+        with override_settings(LOGPIPE=dict(LOGPIPE, MIN_MESSAGE_LAG_MS=500, BULK_SIZE=50)):
+            self.assertEqual(consumer._min_lag_ms, 500)
+            self.assertEqual(consumer._batch_size, 50)
+        self.assertEqual(consumer._min_lag_ms, 0)
+        self.assertEqual(consumer._batch_size, 1)
+
+    @override_settings(LOGPIPE=dict(LOGPIPE, PREFETCH_DEPTH=10))
+    @patch("kafka.KafkaConsumer")
+    def test_prefetching_multi_consumer(self, KafkaConsumer):
+        value = b'json:{"message":{"code":"NY","name":"New York"},"version":1,"type":"us-state"}'
+        self.mock_consumer_records(KafkaConsumer, [(b"NY", value)] * 3)
+        fake_consumer_a = KafkaConsumer.return_value
+        self.mock_consumer_records(KafkaConsumer, [(b"NY", value)] * 2)
+        fake_consumer_b = KafkaConsumer.return_value
+        KafkaConsumer.side_effect = [fake_consumer_a, fake_consumer_b]
+
+        class Done(Exception):
+            pass
+
+        saved = []
+
+        def save(ser):
+            saved.append(ser)
+            if len(saved) >= 5:
+                raise Done()
+
+        FakeStateSerializer = self.mock_state_serializer(save)
+        consumer_a = Consumer(TOPIC_STATES, consumer_timeout_ms=500)
+        consumer_a.register(FakeStateSerializer)
+        consumer_b = Consumer(TOPIC_STATES, consumer_timeout_ms=500)
+        consumer_b.register(FakeStateSerializer)
+
+        # Both consumers' messages are processed, even though each runs out of messages part way
+        with self.assertRaises(Done):
+            MultiConsumer(consumer_a, consumer_b, budget=2).run()
+        self.assertEqual(len(saved), 5)
+        consumer_a.close()
+        consumer_b.close()
+
+    @override_settings(LOGPIPE=dict(LOGPIPE, COMMIT_EVERY_N=2))
+    @patch("logpipe.consumer.get_offset_backend")
+    @patch("kafka.KafkaConsumer")
+    def test_batched_commits(self, KafkaConsumer, get_offset_backend):
+        self.mock_consumer(
+            KafkaConsumer,
+            value=b'json:{"message":{"code":"NY","name":"New York"},"version":1,"type":"us-state"}',
+            max_calls=5,
+        )
+        FakeStateSerializer = self.mock_state_serializer()
+
+        consumer = Consumer(TOPIC_STATES, consumer_timeout_ms=500)
+        consumer.register(FakeStateSerializer)
+        consumer.run()
+
+        # Offsets are committed every 2nd message, plus once more when the run loop exits
+        self.assertEqual(FakeStateSerializer.call_count, 5)
+        self.assertEqual(get_offset_backend.return_value.commit.call_count, 3)
+
+    @override_settings(LOGPIPE=dict(LOGPIPE, BULK_SIZE=10))
+    @patch("kafka.KafkaConsumer")
+    def test_bulk_save(self, KafkaConsumer):
+        values = [
+            b'json:{"message":{"region":"us-east-1","stream":"s","shard":"%d","sequence_number":"1"},"version":1,"type":"shard"}'
+            % i
+            for i in range(5)
+        ]
+        # The last message has the same key as the first one, so it must see the first one's row
+        values.append(
+            b'json:{"message":{"region":"us-east-1","stream":"s","shard":"0","sequence_number":"2"},"version":1,"type":"shard"}'
+        )
+        self.mock_consumer_records(
+            KafkaConsumer,
+            [(str(i % 5).encode(), value) for i, value in enumerate(values)],
+        )
+
+        consumer = Consumer(TOPIC_STATES, consumer_timeout_ms=500)
+        consumer.register(ShardSerializer)
+        with patch.object(
+            KinesisOffset._default_manager,
+            "bulk_create",
+            wraps=KinesisOffset._default_manager.bulk_create,
+        ) as bulk_create:
+            consumer.run()
+
+        self.assertEqual(bulk_create.call_count, 1)
+        self.assertEqual(len(bulk_create.call_args[0][0]), 5)
+        self.assertEqual(KinesisOffset.objects.count(), 5)
+        self.assertEqual(
+            KinesisOffset.objects.get(shard="0").sequence_number,
+            "2",
+        )
+
+    @override_settings(LOGPIPE=LOGPIPE)
+    @patch("kafka.KafkaConsumer")
+    def test_pooled_serializer(self, KafkaConsumer):
+        values = [
+            b'json:{"message":{"region":"us-east-1","stream":"s","shard":"0","sequence_number":"1"},"version":1,"type":"shard"}',
+            b'json:{"message":{"region":"us-east-1","stream":"s","shard":"1","sequence_number":"1"},"version":1,"type":"shard"}',
+            b'json:{"message":{"region":"us-east-1","stream":"s","shard":"0","sequence_number":"2"},"version":1,"type":"shard"}',
+        ]
+        self.mock_consumer_records(KafkaConsumer, [(b"key", value) for value in values])
+
+        consumer = Consumer(TOPIC_STATES, consumer_timeout_ms=500)
+        consumer.register(ShardSerializer)
+        with patch.object(consumer, "_dispatch", wraps=consumer._dispatch) as dispatch:
+            consumer.run()
+
+        # The same serializer instance is reset and reused for every message
+        serializers = set(id(call[0][0]) for call in dispatch.call_args_list)
+        self.assertEqual(dispatch.call_count, 3)
+        self.assertEqual(len(serializers), 1)
+        self.assertEqual(KinesisOffset.objects.count(), 2)
+        self.assertEqual(KinesisOffset.objects.get(shard="0").sequence_number, "2")
+
+    @override_settings(LOGPIPE=dict(LOGPIPE, BULK_SIZE=10))
+    @patch("kafka.KafkaConsumer")
+    def test_bulk_save_same_instance_different_keys(self, KafkaConsumer):
+        KinesisOffset.objects.create(region="us-east-1", stream="s", shard="0", sequence_number="1")
+        value = b'json:{"message":{"region":"us-east-1","stream":"s","shard":"0","sequence_number":"%s"},"version":1,"type":"shard"}'
+        self.mock_consumer_records(KafkaConsumer, [(b"a", value % b"2"), (b"b", value % b"3")])
+
+        consumer = Consumer(TOPIC_STATES, consumer_timeout_ms=500)
+        consumer.register(ShardSerializer)
+        with patch.object(
+            KinesisOffset._default_manager,
+            "bulk_update",
+            wraps=KinesisOffset._default_manager.bulk_update,
+        ) as bulk_update:
+            consumer.run()
+
+        # Both messages look up the same row, so they aren't batched together
+        self.assertEqual(bulk_update.call_count, 0)
+        self.assertEqual(KinesisOffset.objects.get(shard="0").sequence_number, "3")
+
+    @override_settings(LOGPIPE=dict(LOGPIPE, BULK_SIZE=10))
+    @patch("kafka.KafkaConsumer")
+    def test_bulk_update_with_primary_key_field(self, KafkaConsumer):
+        for i in range(2):
+            KinesisOffset.objects.create(id=i + 1, region="us-east-1", stream="s", shard=str(i), sequence_number="1")
+        values = [
+            b'json:{"message":{"id":%d,"region":"us-east-1","stream":"s","shard":"%d","sequence_number":"2"},"version":1,"type":"shard-by-id"}'
+            % (i + 1, i)
+            for i in range(2)
+        ]
+        self.mock_consumer_records(KafkaConsumer, [(str(i).encode(), value) for i, value in enumerate(values)])
+
+        consumer = Consumer(TOPIC_STATES, consumer_timeout_ms=500)
+        consumer.register(ShardByIDSerializer)
+        with patch.object(
+            KinesisOffset._default_manager,
+            "bulk_update",
+            wraps=KinesisOffset._default_manager.bulk_update,
+        ) as bulk_update:
+            consumer.run()
+
+        # The primary key isn't included in the updated fields, so the batch isn't retried one at a time
+        self.assertEqual(bulk_update.call_count, 1)
+        self.assertNotIn("id", bulk_update.call_args[0][1])
+        self.assertEqual(
+            list(KinesisOffset.objects.order_by("id").values_list("sequence_number", flat=True)),
+            ["2", "2"],
+        )
+
+    @override_settings(LOGPIPE=LOGPIPE)
+    @patch("kafka.KafkaConsumer")
+    def test_unpooled_serializer(self, KafkaConsumer):
+        class DynamicShardSerializer(ShardSerializer):
+            def get_fields(self):
+                return super().get_fields()
+
+        value = b'json:{"message":{"region":"us-east-1","stream":"s","shard":"%s","sequence_number":"1"},"version":1,"type":"shard"}'
+        self.mock_consumer_records(KafkaConsumer, [(b"key", value % b"0"), (b"key", value % b"1")])
+
+        consumer = Consumer(TOPIC_STATES, consumer_timeout_ms=500)
+        consumer.register(DynamicShardSerializer)
+        with patch.object(consumer, "_dispatch", wraps=consumer._dispatch) as dispatch:
+            consumer.run()
+
+        # Fields may depend on the instance, so every message gets a new serializer
+        serializers = set(id(call[0][0]) for call in dispatch.call_args_list)
+        self.assertEqual(len(serializers), 2)
+        self.assertEqual(KinesisOffset.objects.count(), 2)
+
+    @override_settings(LOGPIPE=dict(LOGPIPE, TXN_BATCH_SIZE=10, ERROR_TOPIC="errors"))
+    @patch("logpipe.consumer.get_producer_backend")
+    @patch("kafka.KafkaConsumer")
+    def test_batched_transaction_replay(self, KafkaConsumer, get_producer_backend):
+        self.mock_consumer_records(
+            KafkaConsumer,
+            [
+                (code.encode(), b'json:{"message":{"code":"%s","name":"State"},"version":1,"type":"us-state"}' % code.encode())
+                for code in ("NY", "NJ", "CT")
+            ],
+        )
+        saved = []
+
+        def save(ser):
+            if ser.validated_data["code"] == "NJ":
+                raise RuntimeError("Boom")
+            saved.append(ser.validated_data["code"])
+
+        FakeStateSerializer = self.mock_state_serializer(save)
+        consumer = Consumer(TOPIC_STATES, consumer_timeout_ms=500)
+        consumer.register(FakeStateSerializer)
+        consumer.run()
+
+        # The batch fails on NJ, so it's rolled back and replayed one message at a time
+        self.assertEqual(saved, ["NY", "NY", "CT"])
+        self.assertEqual(FakeStateSerializer.call_count, 6)
+        producer_client = get_producer_backend.return_value
+        self.assertEqual(producer_client.send.call_count, 1)
+        self.assertEqual(producer_client.send.call_args[1]["key"], b"NJ")
+
+    @override_settings(LOGPIPE=dict(LOGPIPE, TXN_BATCH_SIZE=10))
+    @patch("logpipe.consumer.get_offset_backend")
+    @patch("kafka.KafkaConsumer")
+    def test_batched_skipped_message_commit_order(self, KafkaConsumer, get_offset_backend):
+        value = b'json:{"message":{"code":"%s","name":"State"},"version":1,"type":"us-state"}'
+        self.mock_consumer_records(
+            KafkaConsumer,
+            [
+                (b"NY", value % b"NY"),
+                (b"NJ", value % b"NJ"),
+                (b"XX", b'json:{"version":1}'),
+                (b"CT", value % b"CT"),
+            ],
+        )
+        events = []
+        FakeStateSerializer = self.mock_state_serializer(
+            lambda ser: events.append(("save", ser.validated_data["code"]))
+        )
+        get_offset_backend.return_value.commit.side_effect = lambda consumer, message: events.append(
+            ("commit", message.offset)
+        )
+        consumer = Consumer(TOPIC_STATES, consumer_timeout_ms=500)
+        consumer.register(FakeStateSerializer)
+        consumer.run()
+
+        # The batch is applied before the invalid message's offset is committed
+        self.assertEqual(
+            events,
+            [
+                ("save", "NY"),
+                ("save", "NJ"),
+                ("commit", 0),
+                ("commit", 1),
+                ("commit", 2),
+                ("save", "CT"),
+                ("commit", 3),
+            ],
+        )
+
+    @override_settings(LOGPIPE=dict(LOGPIPE, TXN_BATCH_SIZE=10))
+    @patch("logpipe.consumer.get_offset_backend")
+    @patch("kafka.KafkaConsumer")
+    def test_batched_offsets_committed_with_batch(self, KafkaConsumer, get_offset_backend):
+        value = b'json:{"message":{"code":"%s","name":"State"},"version":1,"type":"us-state"}'
+        self.mock_consumer_records(KafkaConsumer, [(code, value % code) for code in (b"NY", b"NJ", b"CT")])
+        # Savepoints of the transaction each save and offset commit happens in. Blocks without a
+        # savepoint are recorded as None.
+        save_savepoints = []
+        commit_savepoints = []
+
+        def savepoints():
+            return tuple(sid for sid in connection.savepoint_ids if sid)
+
+        FakeStateSerializer = self.mock_state_serializer(lambda ser: save_savepoints.append(savepoints()))
+        get_offset_backend.return_value.commit.side_effect = lambda consumer, message: commit_savepoints.append(
+            savepoints()
+        )
+        consumer = Consumer(TOPIC_STATES, consumer_timeout_ms=500)
+        consumer.register(FakeStateSerializer)
+        consumer.run()
+
+        self.assertEqual(len(save_savepoints), 3)
+        self.assertEqual(len(set(save_savepoints)), 1)
+        self.assertEqual(commit_savepoints, save_savepoints)
+
+    @override_settings(LOGPIPE=dict(LOGPIPE, TXN_BATCH_SIZE=10))
+    @patch("kafka.KafkaConsumer")
+    def test_batched_validation_against_batch(self, KafkaConsumer):
+        self.mock_consumer_records(
+            KafkaConsumer,
+            [
+                (
+                    b"parent",
+                    b'json:{"message":{"region":"us-east-1","stream":"s","shard":"parent","sequence_number":"1"},"version":1,"type":"shard"}',
+                ),
+                (
+                    b"child",
+                    b'json:{"message":{"region":"us-east-1","stream":"parent","shard":"child","sequence_number":"1"},"version":1,"type":"child-shard"}',
+                ),
+            ],
+        )
+        consumer = Consumer(TOPIC_STATES, consumer_timeout_ms=500)
+        consumer.register(ShardSerializer)
+        consumer.register(ChildShardSerializer)
+        consumer.run()
+
+        # The child only validates once the batched parent has been written
+        self.assertEqual(
+            list(KinesisOffset.objects.order_by("shard").values_list("shard", flat=True)),
+            ["child", "parent"],
+        )
+
+    @override_settings(LOGPIPE=dict(LOGPIPE, BULK_SIZE=10))
+    @patch("kafka.KafkaConsumer")
+    def test_batched_replay_skips_invalid_message(self, KafkaConsumer):
+        value = b'json:{"message":{"region":"us-east-1","stream":"s","shard":"x","sequence_number":"%s"},"version":1,"type":"new-shard"}'
+        self.mock_consumer_records(KafkaConsumer, [(b"a", value % b"1"), (b"b", value % b"2")])
+        consumer = Consumer(TOPIC_STATES, consumer_timeout_ms=500)
+        consumer.register(NewShardSerializer)
+        with self.assertLogs("logpipe.consumer", level="WARNING") as logs:
+            consumer.run()
+
+        # Both rows collide in bulk_create. When replayed, the second one fails validation and is skipped.
+        self.assertEqual(list(KinesisOffset.objects.values_list("sequence_number", flat=True)), ["1"])
+        self.assertTrue(any("Skipping invalid message" in line for line in logs.output))
+
+    @override_settings(LOGPIPE=dict(LOGPIPE, ERROR_TOPIC="errors"))
+    @patch("logpipe.consumer._parse", wraps=_parse)
+    @patch("logpipe.consumer.get_producer_backend")
+    @patch("kafka.KafkaConsumer")
+    def test_send_to_error_topic(self, KafkaConsumer, get_producer_backend, parse):
+        self.mock_consumer(
+            KafkaConsumer,
+            value=b'json:{"message":{"code":"NY","name":"New York"},"version":1,"type":"us-state"}',
+        )
+
+        def save(ser):
+            raise RuntimeError("Boom")
+
+        FakeStateSerializer = self.mock_state_serializer(save)
+        consumer = Consumer(TOPIC_STATES, consumer_timeout_ms=500)
+        consumer.register(FakeStateSerializer)
+        consumer.run(iter_limit=1)
+
+        # The message is forwarded to the error topic without parsing it a second time
+        self.assertEqual(parse.call_count, 1)
+        producer_client = get_producer_backend.return_value
+        self.assertEqual(producer_client.send.call_count, 1)
+        args, kwargs = producer_client.send.call_args
+        self.assertEqual(args, ("errors",))
+        self.assertEqual(kwargs["key"], b"NY")
+        self.assertIn(b'"error":"Boom"', kwargs["value"])
+        self.assertIn(b'"can_retry":true', kwargs["value"])
+
     @patch("kafka.KafkaConsumer")
     def test_missing_version_throws(self, KafkaConsumer):
         self.mock_consumer(
@@ -153,9 +634,36 @@ class ConsumerTest(BaseTest):
         FakeStateSerializer = self.mock_state_serializer()
         consumer = Consumer(TOPIC_STATES, consumer_timeout_ms=500)
         consumer.register(FakeStateSerializer)
-        consumer.run(iter_limit=1)
+        with self.assertLogs("logpipe.consumer", level="WARNING") as logs:
+            consumer.run(iter_limit=1)
         self.assertEqual(FakeStateSerializer.call_count, 1)
         self.assertEqual(self.serializers["state"].save.call_count, 0)
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("Skipping invalid message in topic us-states", logs.output[0])
+        self.assertIn("code", logs.output[0])
+
+    @override_settings(LOGPIPE=LOGPIPE)
+    @patch("kafka.KafkaConsumer")
+    def test_lookup_instance_error_ignored(self, KafkaConsumer):
+        class StrictShardSerializer(ShardSerializer):
+            @classmethod
+            def lookup_instance(cls, shard, **kwargs):
+                if shard == "bad":
+                    raise serializers.ValidationError("bad shard")
+                return super().lookup_instance(shard, **kwargs)
+
+        value = b'json:{"message":{"region":"us-east-1","stream":"s","shard":"%s","sequence_number":"1"},"version":1,"type":"shard"}'
+        self.mock_consumer_records(KafkaConsumer, [(b"bad", value % b"bad"), (b"good", value % b"good")])
+        consumer = Consumer(TOPIC_STATES, consumer_timeout_ms=500)
+        consumer.register(StrictShardSerializer)
+        with self.assertLogs("logpipe.consumer", level="WARNING") as logs:
+            consumer.run()
+
+        # The message is skipped and the consumer carries on with the next one
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("Skipping invalid message in topic us-states", logs.output[0])
+        self.assertIn("bad shard", logs.output[0])
+        self.assertEqual(list(KinesisOffset.objects.values_list("shard", flat=True)), ["good"])
 
     @patch("kafka.KafkaConsumer")
     def test_ignored_message_type_is_ignored(self, KafkaConsumer):
@@ -172,6 +680,31 @@ class ConsumerTest(BaseTest):
         self.assertEqual(FakeStateSerializer.call_count, 0)
         self.assertTrue("state" not in self.serializers)
 
+    def mock_consumer_records(self, KafkaConsumer, records):
+        # Mock a consumer object which returns a record for each (key, value) pair and then
+        # raises StopIteration
+        fake_kafka_consumer = MagicMock()
+        fake_kafka_consumer.__next__.side_effect = [
+            ConsumerRecord(
+                topic=TOPIC_STATES,
+                partition=0,
+                offset=offset,
+                timestamp=1467649216540,
+                timestamp_type=0,
+                key=key,
+                value=value,
+                headers=None,
+                checksum=binascii.crc32(value),
+                serialized_key_size=key,
+                serialized_value_size=value,
+                serialized_header_size=0,
+            )
+            for offset, (key, value) in enumerate(records)
+        ] + [StopIteration()]
+        fake_kafka_consumer.partitions_for_topic.return_value = set([0, 1])
+        KafkaConsumer.return_value = fake_kafka_consumer
+        return fake_kafka_consumer
+
     def mock_consumer(self, KafkaConsumer, value, max_calls=1):
         # Mock a consumer object
         fake_kafka_consumer = MagicMock()
@@ -79,6 +79,38 @@ class ProducerTest(TestCase):
         KafkaProducer.assert_called_with(bootstrap_servers=["kafka:9092"], retries=5)
         future.get.assert_called_with(timeout=5)
 
+    @override_settings(LOGPIPE=LOGPIPE)
+    @patch("kafka.KafkaProducer")
+    def test_send_many(self, KafkaProducer):
+        future = MagicMock()
+        future.get.return_value = self._get_record_metadata()
+
+        client = MagicMock()
+        client.send.return_value = future
+        KafkaProducer.return_value = client
+
+        producer = Producer(TOPIC_STATES, StateSerializer)
+        ny = StateModel()
+        ny.code = "NY"
+        ny.name = "New York"
+        pa = StateModel()
+        pa.code = "PA"
+        pa.name = "Pennsylvania"
+        ret = producer.send_many([ny, pa])
+
+        self.assertEqual(len(ret), 2)
+        self.assertEqual(ret[0].topic, TOPIC_STATES)
+        self.assertEqual(ret[0].partition, 0)
+        self.assertEqual(ret[0].offset, 42)
+        self.assertEqual(client.send.call_count, 2)
+        self.assertEqual(client.send.call_args_list[0][1]["key"], b"NY")
+        self.assertIn(b'"name":"New York"', client.send.call_args_list[0][1]["value"])
+        self.assertEqual(client.send.call_args_list[1][1]["key"], b"PA")
+        self.assertIn(b'"name":"Pennsylvania"', client.send.call_args_list[1][1]["value"])
+        # Sends are flushed once, rather than waiting on each message in turn
+        client.flush.assert_called_once_with(timeout=5)
+        self.assertEqual(future.get.call_count, 2)
+
     def _get_record_metadata(self):
         return ConsumerRecord(
             topic=TOPIC_STATES,
@@ -2,8 +2,11 @@ from django.test import TestCase, override_settings
 from logpipe.constants import FORMAT_PICKLE
 from logpipe.exceptions import UnknownFormatError
 from logpipe.formats.pickle import PickleRenderer, PickleParser
+from rest_framework.exceptions import ParseError
+import datetime
 import logpipe.format
 import pickle
+import uuid
 
 
 class JSONFormatTest(TestCase):
@@ -25,6 +28,47 @@ class JSONFormatTest(TestCase):
             },
         )
 
+    def test_render_uuid(self):
+        msg = logpipe.format.render(
+            "json",
+            {
+                "uuid": uuid.UUID("0f8f3b2e-7a4c-4e0a-9a36-2f3c1b7e2d11"),
+            },
+        )
+        self.assertEqual(msg, b'json:{"uuid":"0f8f3b2e-7a4c-4e0a-9a36-2f3c1b7e2d11"}')
+
+    def test_render_big_int(self):
+        msg = logpipe.format.render("json", {"foo": 2**70})
+        self.assertEqual(msg, b'json:{"foo":1180591620717411303424}')
+
+    def test_parse_big_int(self):
+        data = logpipe.format.parse(logpipe.format.render("json", {"foo": 2**70 + 1, "bar": -(2**64) - 1}))
+        self.assertEqual(data, {"foo": 2**70 + 1, "bar": -(2**64) - 1})
+        self.assertIsInstance(data["foo"], int)
+        self.assertEqual(logpipe.format.parse(b'json:{"foo":18446744073709551615}'), {"foo": 2**64 - 1})
+
+    def test_render_datetime(self):
+        msg = logpipe.format.render(
+            "json",
+            {
+                "at": datetime.datetime(2018, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc),
+                "on": datetime.date(2018, 1, 2),
+            },
+        )
+        self.assertEqual(msg, b'json:{"at":"2018-01-02T03:04:05Z","on":"2018-01-02"}')
+
+    def test_render_non_finite_float(self):
+        with self.assertRaises(ValueError):
+            logpipe.format.render("json", {"foo": [None, float("nan")]})
+        with self.assertRaises(ValueError):
+            logpipe.format.render("json", {"foo": {"bar": float("inf")}})
+        msg = logpipe.format.render("json", {"foo": None, "bar": 1.5})
+        self.assertEqual(msg, b'json:{"foo":null,"bar":1.5}')
+
+    def test_parse_invalid(self):
+        with self.assertRaises(ParseError):
+            logpipe.format.parse(b'json:{"foo":')
+
 
 class MsgPackFormatTest(TestCase):
     def test_render(self):
@@ -48,3 +48,45 @@ class ProducerTest(TestCase):
         producer.send(ny)
 
         self.assertEqual(fake_client.send.call_count, 1)
+
+    def test_send_renderer(self):
+        fake_client = mock.MagicMock()
+
+        def check_args(topic, key, value):
+            self.assertEqual(topic, TOPIC_STATES)
+            self.assertEqual(key, "NY")
+            self.assertTrue(value.startswith(b"msgpack:"))
+
+        fake_client.send.side_effect = check_args
+
+        get_producer_backend = mock.MagicMock()
+        get_producer_backend.return_value = fake_client
+
+        with mock.patch("logpipe.producer.get_producer_backend", get_producer_backend):
+            producer = Producer(TOPIC_STATES, StateSerializer)
+
+        producer.send({"code": "NY", "name": "New York"}, renderer="msgpack")
+
+        self.assertEqual(fake_client.send.call_count, 1)
+
+    def test_send_json_envelope(self):
+        fake_client = mock.MagicMock()
+
+        get_producer_backend = mock.MagicMock()
+        get_producer_backend.return_value = fake_client
+
+        with mock.patch("logpipe.producer.get_producer_backend", get_producer_backend):
+            producer = Producer(TOPIC_STATES, StateSerializer)
+
+        producer.send({"code": "NY", "name": "New York"})
+        producer.send({"code": "PA"}, action_type="delete")
+
+        self.assertEqual(fake_client.send.call_count, 2)
+        self.assertEqual(
+            fake_client.send.call_args_list[0][1]["value"],
+            b'json:{"type":"us-state","version":1,"action_type":"save","message":{"code":"NY","name":"New York"}}',
+        )
+        self.assertEqual(
+            fake_client.send.call_args_list[1][1]["value"],
+            b'json:{"type":"us-state","version":1,"action_type":"delete","message":{"code":"PA"}}',
+        )